@@ -1,77 +1,195 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import polars as pl
 import openpyxl
-from openpyxl.styles import Border, Side, Font
-from openpyxl.utils.dataframe import dataframe_to_rows
+import xlsxwriter
 import io
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Set the favicon and title for the app
 st.set_page_config(page_title="Excel Automation", page_icon="📊", layout="wide")
 
+# Read-only workbook exposing the parts of pd.ExcelFile used by the app
+class ReadOnlyExcel:
+    def __init__(self, file):
+        self.workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        self.sheet_names = self.workbook.sheetnames
+
+    def parse(self, sheet, header=1):
+        ws = self.workbook[sheet]
+        # Some writers store a wrong (or no) dimension record, which would truncate the rows we read
+        try:
+            if ws.calculate_dimension() == 'A1:A1':
+                ws.reset_dimensions()
+        except ValueError:
+            ws.reset_dimensions()
+
+        # Read-only rows are padded to max_column, so trim trailing blanks (formatted but empty cells)
+        rows = []
+        for row in ws.iter_rows(values_only=True):
+            row = list(row)
+            while row and row[-1] is None:
+                row.pop()
+            rows.append(row)
+        if len(rows) <= header:
+            return pd.DataFrame(columns=[])
+        width = max(len(row) for row in rows)
+        columns = make_column_names(rows[header], width)
+        # The header is picked by position; only blank rows below it are dropped.
+        # Rows are padded to the full width since a trailing column may be blank on every data row
+        data = [row + [None] * (width - len(row)) for row in rows[header + 1:] if row]
+        return pd.DataFrame(data, columns=columns)
+
+    def close(self):
+        self.workbook.close()
+
+# Function to name header cells the same way pandas does (blank -> "Unnamed: i", duplicates -> "name.1")
+def make_column_names(header_row, width):
+    columns = []
+    seen = {}
+    for i in range(width):
+        value = header_row[i] if i < len(header_row) else None
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        columns.append(name)
+    return columns
+
 # Function to load an Excel file and show available sheet names
 def load_excel(file):
-    xls = pd.ExcelFile(file)
+    xls = ReadOnlyExcel(file)
     return xls, xls.sheet_names
 
+# Function to parse every sheet once per uploaded file (cached across reruns)
+@st.cache_data(show_spinner=False)
+def load_all_sheets(file_bytes: bytes) -> dict[str, pd.DataFrame]:
+    xls, sheet_names = load_excel(io.BytesIO(file_bytes))
+    try:
+        return {sheet: clean_column_names(xls.parse(sheet, header=1)) for sheet in sheet_names}
+    finally:
+        xls.close()
+
 # Function to clean column names
 def clean_column_names(df):
-    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+    df.columns = [col.strip().lower().replace(' ', '_') for col in df.columns]
     return df
 
+# Function to convert a column to an Arrow string array (values rendered as text, blanks stay null)
+def to_arrow_text(series):
+    return pa.array(series.astype("string[pyarrow]").array)
+
+# Function to join the given columns into one lowercase search string per row
+def build_haystack(df, columns):
+    # \x1f (unit separator) keeps a match from spanning two cells
+    separator = pa.scalar("\x1f", pa.large_string())
+    # Select by position: cleaned names can collide ("Name" and "name " both become "name")
+    wanted = set(columns)
+    texts = [to_arrow_text(df.iloc[:, i]) for i, col in enumerate(df.columns) if col in wanted]
+    joined = pc.binary_join_element_wise(*texts, separator, null_handling="replace", null_replacement="")
+    return pc.utf8_lower(joined)
+
+# Function to join the given text columns of a sheet into a single lowercase string (kept as a 1-element Arrow array)
+def build_sheet_text(df, columns):
+    haystack = build_haystack(df, columns)
+    rows = pa.LargeListArray.from_arrays(pa.array([0, len(haystack)], pa.int64()), haystack)
+    return pc.binary_join(rows, pa.scalar("\x1e", pa.large_string()))
+
+# Function to flag the rows whose search string contains the (lowercase) needle
+def match_rows(haystack, needle):
+    return haystack.str.contains(needle, literal=True).to_numpy()
+
 # Function to filter data across selected sheets
-def filter_sheets(xls, selected_sheets, filter_value, selected_columns):
-    filtered_data = {}
-    for sheet in selected_sheets:
-        df = xls.parse(sheet, header=1)
-        df = clean_column_names(df)
-        valid_columns = [col for col in selected_columns if col in df.columns]
-        if valid_columns:
-            filtered_df = df[df[valid_columns].apply(lambda row: row.astype(str).str.contains(filter_value, case=False, na=False).any(), axis=1)]
-            filtered_data[sheet] = filtered_df
-    return filtered_data
+# haystacks caches the search strings per (sheet, columns) so changing only the filter value skips rebuilding them
+# sheet_texts caches each sheet's text-column content so sheets that do not contain the value can be skipped outright
+def filter_sheets(sheets, selected_sheets, filter_value, selected_columns, haystacks=None, sheet_texts=None):
+    if haystacks is None:
+        haystacks = {}
+    # Lowercased once with the same Arrow kernel as the cached search strings, so a value always matches itself
+    needle = pc.utf8_lower(pa.scalar(filter_value)).as_py()
+    column_sets = {sheet: set(sheets[sheet].columns) for sheet in selected_sheets}
+
+    def filter_one(sheet):
+        df = sheets[sheet]
+        valid_columns = [col for col in selected_columns if col in column_sets[sheet]]
+        if not valid_columns:
+            return sheet, None
+        # The sheet text only covers text columns, so it can only rule out filters on those
+        text_columns = df.select_dtypes(include=["object", "string"]).columns.tolist()
+        if sheet_texts is not None and set(valid_columns) <= set(text_columns):
+            if sheet not in sheet_texts:
+                sheet_texts[sheet] = build_sheet_text(df, text_columns)
+            if not pc.match_substring(sheet_texts[sheet], needle)[0].as_py():
+                return sheet, df.iloc[:0]
+        key = (sheet, tuple(valid_columns))
+        if key not in haystacks:
+            haystacks[key] = pl.from_arrow(build_haystack(df, valid_columns))
+        return sheet, df[match_rows(haystacks[key], needle)]
+
+    # The Arrow and Polars kernels release the GIL, so sheets are scanned in parallel
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(selected_sheets)))) as executor:
+        results = dict(executor.map(filter_one, selected_sheets))
+    return {sheet: df for sheet, df in results.items() if df is not None}
 
 # Function to calculate subtotals and append them to the filtered data
 def calculate_subtotals(df, subtotal_columns):
-    subtotal_row = {}
-    for col in subtotal_columns:
-        if col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                subtotal_row[col] = df[col].sum()
-            else:
-                subtotal_row[col] = "N/A"
-    return subtotal_row
-
-# Function to apply borders to all cells in a sheet
-def apply_borders(sheet):
-    thin_border = Border(left=Side(style='thin'),
-                         right=Side(style='thin'),
-                         top=Side(style='thin'),
-                         bottom=Side(style='thin'))
-    for row in sheet.iter_rows():
-        for cell in row:
-            cell.border = thin_border
-
-# Function to apply bold font to the header row
-def apply_bold_header(sheet):
-    for cell in sheet[1]:
-        cell.font = Font(bold=True)
+    columns = [col for col in subtotal_columns if col in df.columns]
+    # One reduction over all numeric columns instead of a dtype check and sum per column
+    sums = df[columns].select_dtypes(include=["number", "bool"]).sum()
+    return {col: sums[col] if col in sums.index else "N/A" for col in columns}
+
+# Sheets with this many data rows or more are saved without cell borders
+BORDER_ROW_LIMIT = 10_000
+
+# Function to register the cell formats once per workbook, keyed by value type (None is the fallback)
+def make_cell_formats(workbook, border):
+    # A cell format replaces xlsxwriter's default date format, so date/time values get their own
+    props = {'border': 1} if border else {}
+    datetime_format = workbook.add_format({**props, 'num_format': 'yyyy-mm-dd hh:mm:ss'})
+    return {
+        None: workbook.add_format(props) if border else None,
+        datetime.datetime: datetime_format,
+        pd.Timestamp: datetime_format,
+        datetime.date: workbook.add_format({**props, 'num_format': 'yyyy-mm-dd'}),
+        datetime.time: workbook.add_format({**props, 'num_format': 'hh:mm:ss'}),
+    }
+
+# Function to stream a DataFrame into a worksheet row by row (blank cells only get the cell format)
+def write_rows(worksheet, df, header_format, cell_formats):
+    worksheet.write_row(0, 0, list(df.columns), header_format)
+    # Formats are picked per value, so dates inside mixed object columns keep a date format
+    fallback = cell_formats[None]
+    values = df.astype(object).where(df.notna(), None)
+    for row_idx, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        for col_idx, value in enumerate(row):
+            worksheet.write(row_idx, col_idx, value, cell_formats.get(type(value), fallback))
 
 # Function to save the filtered data and calculated subtotals into a new Excel file
-def save_filtered_data(xls, selected_sheets, filtered_data, subtotal_columns):
+def save_filtered_data(filtered_data, subtotal_columns, add_borders=True):
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        workbook = writer.book
-        for sheet_name, df in filtered_data.items():
-            sheet = workbook.create_sheet(sheet_name)
-            for row in dataframe_to_rows(df, index=False, header=True):
-                sheet.append(row)
-            
-            # Calculate subtotals and add them to the bottom of the data
-            subtotal_row = calculate_subtotals(df, subtotal_columns)
-            sheet.append([subtotal_row.get(col, "") for col in df.columns])
-            
-            apply_borders(sheet)
-            apply_bold_header(sheet)
+    # constant_memory flushes each row as soon as the next one starts, so rows must be written in order.
+    # Strings are stored as plain text, never turned into hyperlinks or formulas
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False, 'strings_to_formulas': False})
+    bordered_formats = make_cell_formats(workbook, border=True)
+    plain_formats = make_cell_formats(workbook, border=False)
+    header_format = workbook.add_format({'bold': True, 'border': 1})
+    for sheet_name, df in filtered_data.items():
+        worksheet = workbook.add_worksheet(sheet_name)
+        # The header keeps its bold+border format either way
+        if add_borders and len(df) < BORDER_ROW_LIMIT:
+            cell_formats = bordered_formats
+        else:
+            cell_formats = plain_formats
+        write_rows(worksheet, df, header_format, cell_formats)
+
+        # Calculate subtotals and add them to the bottom of the data
+        subtotal_row = calculate_subtotals(df, subtotal_columns)
+        worksheet.write_row(len(df) + 1, 0, [subtotal_row.get(col, "") for col in df.columns], cell_formats[None])
+    workbook.close()
     return output.getvalue()
 
 # Streamlit UI
@@ -79,7 +197,16 @@ st.title("📊 Excel Data Filter Automation")
 
 uploaded_file = st.file_uploader("📂 Upload your Excel file", type=["xlsx"])
 if uploaded_file is not None:
-    xls, sheet_names = load_excel(uploaded_file)
+    # Parse the workbook only when a different file is uploaded
+    file_bytes = uploaded_file.getvalue()
+    file_hash = hash(file_bytes)
+    if st.session_state.get('file_hash') != file_hash:
+        st.session_state['sheets'] = load_all_sheets(file_bytes)
+        st.session_state['haystacks'] = {}
+        st.session_state['sheet_texts'] = {}
+        st.session_state['file_hash'] = file_hash
+    sheets = st.session_state['sheets']
+    sheet_names = list(sheets)
     st.success(f"✅ File loaded successfully! Found {len(sheet_names)} sheets.")
     
     # Declare these variables in session state to retain values across tabs
@@ -98,21 +225,20 @@ if uploaded_file is not None:
         selected_sheets = st.multiselect("📜 Select sheets to filter", options=sheet_names)
     with col2:
         if selected_sheets:
-            all_columns = set()
-            for sheet in selected_sheets:
-                df = xls.parse(sheet, header=1)
-                df = clean_column_names(df)
-                all_columns.update(df.columns.tolist())
+            # Ordered de-duplication keeps the options stable across reruns
+            all_columns = list(dict.fromkeys(col for sheet in selected_sheets for col in sheets[sheet].columns))
 
             filter_value = st.text_input("🔍 Enter value to filter", "")
-            selected_columns = st.multiselect("Select columns to filter", options=list(all_columns))
-            subtotal_columns = st.multiselect("Select columns for subtotal", options=list(all_columns))
+            selected_columns = st.multiselect("Select columns to filter", options=all_columns)
+            subtotal_columns = st.multiselect("Select columns for subtotal", options=all_columns)
+            add_borders = st.checkbox("Add cell borders (slow for large sheets)", value=True)
 
     if selected_sheets:
         st.markdown("---")
         with st.expander("Show Filtered Data Preview"):
             if filter_value and selected_columns:
-                filtered_data = filter_sheets(xls, selected_sheets, filter_value, selected_columns)
+                filtered_data = filter_sheets(sheets, selected_sheets, filter_value, selected_columns,
+                                              st.session_state['haystacks'], st.session_state['sheet_texts'])
                 if filtered_data:
                     st.session_state['filtered_data'] = filtered_data
                     st.session_state['selected_columns'] = selected_columns
@@ -125,7 +251,7 @@ if uploaded_file is not None:
                         st.dataframe(df.head())  # Display the first few rows
 
                     # Save filtered data with subtotals
-                    output_data = save_filtered_data(xls, selected_sheets, filtered_data, subtotal_columns)
+                    output_data = save_filtered_data(filtered_data, subtotal_columns, add_borders)
                     st.download_button(
                         label="⬇️ Download Filtered Excel with Subtotals", 
                         data=output_data,